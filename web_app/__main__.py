@@ -1,5 +1,6 @@
 import functools
 import json
+import logging
 from sre_constants import IN
 import sys
 from typing import Callable, Tuple, Union
@@ -51,6 +52,7 @@ def get_user(request: Request, user_id: str) -> Union[dict, Tuple[str, dict]]:
 
 
 def main() -> int:
+    logging.basicConfig(level=logging.INFO)
     server = HTTPServer()
     server.mount("", app)
     server.serve_forever()
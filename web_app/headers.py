@@ -1,32 +1,61 @@
-from collections import defaultdict
-
-
 class Headers:
-    """A mapping from lower-cased header names to lists of string values.
+    """A case-insensitive mapping from header names to string values.
+
+    Almost no request repeats a header, so values are stored as plain
+    strings and only promoted to a list of strings when a duplicate
+    name shows up.
     """
 
     def __init__(self):
-        self._headers = defaultdict(list)
+        self._headers = {}
 
     def add(self, name, value):
-        self._headers[name.lower()].append(value)
+        name = name.lower()
+        existing = self._headers.get(name)
+        if existing is None:
+            self._headers[name] = value
+        elif isinstance(existing, list):
+            existing.append(value)
+        else:
+            self._headers[name] = [existing, value]
 
     def get_all(self, name):
-        return self._headers[name.lower()]
+        values = self._headers.get(name.lower())
+        if values is None:
+            return []
+
+        if isinstance(values, list):
+            return values
+
+        return [values]
 
     def get(self, name, default=None):
-        try:
-            return self.get_all(name)[-1]
-        except IndexError:
+        values = self._headers.get(name.lower())
+        if values is None:
             return default
 
+        if isinstance(values, list):
+            return values[-1]
+
+        return values
+
     def get_int(self, name):
-        try:
-            return int(self.get(name))
-        except (TypeError, ValueError):
+        # Most requests don't carry the header at all (eg.
+        # content-length on a GET), so short-circuit the miss and use
+        # a decimal check instead of catching ValueError from int --
+        # exception dispatch costs far more than the scan.  isdecimal,
+        # not isdigit: the latter accepts superscripts like "²" (which
+        # latin-1 values can contain) that int() then rejects.
+        value = self.get(name)
+        if value is None or not value.isdecimal():
             return None
 
+        return int(value)
+
     def __iter__(self):
         for name, values in self._headers.items():
-            for value in values:
-                yield name, value
+            if isinstance(values, list):
+                for value in values:
+                    yield name, value
+            else:
+                yield name, values
@@ -1,6 +1,8 @@
-from typing import Dict, Generator, List, Optional, Tuple, overload
+from typing import Dict, Generator, List, Optional, Tuple, Union, overload
 
-HeadersDict = Dict[str, List[str]]
+# Values are plain strings until a duplicate name promotes them to a
+# list of strings.
+HeadersDict = Dict[str, Union[str, List[str]]]
 HeadersGenerator = Generator[Tuple[str, str], None, None]
 
 
@@ -5,53 +5,122 @@ import typing
 from .headers import Headers
 
 
-# https://stackoverflow.com/questions/12637768/python-3-send-method-of-generators
-def iter_lines(sock: socket.socket, bufsize: int = 16_384) -> typing.Generator[bytes, None, bytes]:
-    """Given a socket, read all the individual CRLF-separated lines
-    and yield each one until an empty one is found.  Returns the
-    remainder after the empty line.
+def read_until_headers(
+        sock: socket.socket, buff: bytes = b"", bufsize: int = 65_536) -> typing.Tuple[bytes, bytes]:
+    """Given a socket, read until the CRLFCRLF terminator that ends the
+    header block.  buff holds bytes already read off of the socket (eg.
+    by a previous request on the same connection).  Returns the header
+    block (without the terminator) and whatever was read past it.
+
+    Raises:
+      EOFError: When the connection closes before any data arrives.
+      ValueError: When the connection closes mid-headers or the header
+        block doesn't fit in bufsize bytes.
     """
-    buff = b""
-    while True:
-        data = sock.recv(bufsize)
-        if not data:
-            return b""
-
-        buff += data
-        while True:
-            try:
-                i = buff.index(b"\r\n")
-                line, buff = buff[:i], buff[i + 2:]
-                if not line:
-                    return buff
-
-                yield line
-            except IndexError:
-                break
+    buf = bytearray(max(bufsize, len(buff) + 1))
+    buf[:len(buff)] = buff
+    view = memoryview(buf)
+    received = len(buff)
+
+    i = buf.find(b"\r\n\r\n", 0, received)
+    while i < 0:
+        if received == len(buf):
+            raise ValueError("Header block too large.")
+
+        n = sock.recv_into(view[received:])
+        if not n:
+            if not received:
+                raise EOFError("Client closed the connection.")
+
+            raise ValueError("Connection closed before the end of the headers.")
+
+        # The terminator may straddle two recvs, so back up far enough
+        # to catch it without rescanning the whole buffer.
+        i = buf.find(b"\r\n\r\n", max(received - 3, 0), received + n)
+        received += n
+
+    return bytes(view[:i]), bytes(view[i + 4:received])
 
 
 class BodyReader(io.IOBase):
-    def __init__(self, sock: socket.socket, *, buff: bytes = b"", bufsize: int = 16_384) -> None:
+    def __init__(
+            self, sock: socket.socket, *, buff: bytes = b"", bufsize: int = 16_384,
+            limit: typing.Optional[int] = None) -> None:
         self._sock = sock
-        self._buff = buff
-        self._bufsize = bufsize
+        self._buf = bytearray(max(bufsize, len(buff)))
+        self._buf[:len(buff)] = buff
+        self._view = memoryview(self._buf)
+        self._pos = 0
+        self._len = len(buff)
+        self._limit = limit
+        self._consumed = 0
 
     def readable(self) -> bool:
         return True
 
     def read(self, n: int) -> bytes:
-        """Read up to n number of bytes from the request body.
+        """Read up to n number of bytes from the request body, never
+        past the body's content-length.
         """
-        while len(self._buff) < n:
-            data = self._sock.recv(self._bufsize)
-            if not data:
+        if self._limit is not None:
+            n = min(n, self._limit - self._consumed)
+            if n <= 0:
+                return b""
+
+        while self._len - self._pos < n:
+            if len(self._buf) - self._pos < n:
+                self._compact(n)
+
+            received = self._sock.recv_into(self._view[self._len:])
+            if not received:
                 break
 
-            self._buff += data
+            self._len += received
+
+        # Consumed bytes stay in place behind self._pos instead of
+        # being slid out of the buffer, so each read costs a single
+        # copy out of the view rather than a copy plus a shift.
+        n = min(n, self._len - self._pos)
+        res = bytes(self._view[self._pos:self._pos + n])
+        self._pos += n
+        self._consumed += n
+        if self._pos == self._len:
+            self._pos = self._len = 0
 
-        res, self._buff = self._buff[:n], self._buff[n:]
         return res
 
+    def drain(self) -> bytes:
+        """Read and discard whatever is left of the body, returning any
+        bytes that were received past it (ie. the start of the next
+        request on a keep-alive connection).
+        """
+        if self._limit is not None:
+            while self._consumed < self._limit:
+                data = self.read(min(self._limit - self._consumed, len(self._buf)))
+                if not data:
+                    break
+
+        leftover = bytes(self._view[self._pos:self._len])
+        self._pos = self._len = 0
+        return leftover
+
+    def _compact(self, size: int) -> None:
+        """Slide the unread bytes to the front of the buffer, growing
+        it if it can't hold size bytes, to make room for more data.
+        """
+        remaining = self._len - self._pos
+        if size > len(self._buf):
+            buf = bytearray(size)
+            buf[:remaining] = self._view[self._pos:self._len]
+            self._view.release()
+            self._buf = buf
+            self._view = memoryview(buf)
+        else:
+            self._buf[:remaining] = self._buf[self._pos:self._len]
+
+        self._pos = 0
+        self._len = remaining
+
 
 class Request(typing.NamedTuple):
     method: str
@@ -60,40 +129,60 @@ class Request(typing.NamedTuple):
     body: BodyReader
 
     @classmethod
-    def from_socket(cls, sock: socket.socket) -> "Request":
-        """Read and parse the request from a socket object.
+    def from_socket(cls, sock: socket.socket, buff: bytes = b"") -> "Request":
+        """Read and parse the request from a socket object.  buff holds
+        bytes already read off of the socket ahead of this request.
 
         Raises:
+          EOFError: When the connection closes before the request starts.
           ValueError: When the request cannot be parsed.
         """
-        lines = iter_lines(sock)
+        header_block, buff = read_until_headers(sock, buff)
+        lines = header_block.split(b"\r\n")
 
-        try:
-            request_line = next(lines).decode("ascii")
-        except StopIteration:
-            raise ValueError("Request line missing")
-
-        try:
-            method, path, _ = request_line.split(" ")
-        except ValueError:
+        # Bounded split plus an explicit length check keeps the fast
+        # path free of exception handling.
+        parts = lines[0].split(b" ", 2)
+        if len(parts) != 3 or not parts[1] or not parts[2].startswith(b"HTTP/"):
             # https://stackoverflow.com/questions/44800801/in-python-format-f-string-strings-what-does-r-mean
             # https://stackoverflow.com/questions/1436703/what-is-the-difference-between-str-and-repr
-            raise ValueError(f"Malformed request line {request_line!r}.")
+            raise ValueError(f"Malformed request line {lines[0]!r}.")
+
+        method = parts[0].decode("ascii")
+        path = parts[1].decode("ascii")
 
         headers = Headers()
-        buff = b""
-        while True:
-            try:
-                line = next(lines)
-            except StopIteration as e:
-                buff = e.value
-                break
+        for line in lines[1:]:
+            # Splitting on CRLF can't leave a full CRLF in a line, but
+            # a bare CR or LF can survive it.  Lenient parsers that
+            # treat those as line endings are a known request-smuggling
+            # vector, so reject them outright.
+            if b"\r" in line or b"\n" in line:
+                raise ValueError(f"Malformed header line {line!r}")
 
-            try:
-                name, _, value = line.decode("ascii").partition(":")
-                headers.add(name, value.lstrip())
-            except ValueError:
+            name, _, value = line.partition(b":")
+            if not name:
                 raise ValueError(f"Malformed header line {line!r}")
 
-        body = BodyReader(sock, buff=buff)
+            # Optional whitespace is legal on both sides of the value,
+            # and a strict consumer like Headers.get_int chokes on a
+            # trailing space, so trim both ends.  Field values are
+            # ISO-8859-1 on the wire, and latin-1 is a straight 1:1
+            # byte copy that can never fail mid-value the way a
+            # multibyte decode can.
+            headers.add(name.decode("ascii"), value.strip().decode("latin-1"))
+
+        content_length = headers.get_int("content-length")
+        if content_length is None:
+            # A content-length that's present but unparseable must be
+            # rejected (RFC 7230 section 3.3.2): defaulting it to "no
+            # body" would leave the body bytes on the wire to be read
+            # as the next request -- the same desync the bare-CR check
+            # guards against.
+            if headers.get("content-length") is not None:
+                raise ValueError("Malformed content-length header.")
+
+            content_length = 0
+
+        body = BodyReader(sock, buff=buff, limit=content_length)
         return cls(method=method.upper(), path=path, headers=headers, body=body)
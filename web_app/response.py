@@ -5,6 +5,10 @@ import typing
 
 from .headers import Headers
 
+# Head + body pairs up to this size get concatenated and written with
+# one sendall; anything bigger isn't worth the copy.
+_COALESCE_MAX_SIZE = 16_384
+
 
 class Response:
     """An HTTP response.
@@ -12,21 +16,27 @@ class Response:
     Parameters:
       status: The resposne status line (eg. "200 OK").
       headers: The response headers.
-      body: A file containing the response body.
+      body: A file or an in-memory buffer containing the response body.
       content: A string representing the response body.  If this is
         provided, then body is ignored.
       encoding: An encoding for the content, if provided.
+      head: A pre-serialized status line and header block (including
+        the trailing blank line).  If this is provided, then send()
+        writes it as-is instead of serializing status and headers.
     """
 
     status: bytes
     headers: Headers
-    body: typing.IO[bytes]
+    body: typing.Union[typing.IO[bytes], memoryview]
+    head: typing.Optional[bytes]
 
     def __init__(
-            self, status: str, headers: typing.Optional[Headers] = None, body: typing.Optional
-            [typing.IO[bytes]] = None, content: typing.Optional[str] = None, encoding: str = "utf-8") -> None:
+            self, status: str, headers: typing.Optional[Headers] = None, body: typing.Union
+            [typing.IO[bytes], memoryview, None] = None, content: typing.Optional[str] = None,
+            encoding: str = "utf-8", head: typing.Optional[bytes] = None) -> None:
         self.status = status.encode()
         self.headers = headers or Headers()
+        self.head = head
 
         if content is not None:
             self.body = io.BytesIO(content.encode(encoding))
@@ -37,24 +47,77 @@ class Response:
 
     def send(self, sock: socket.socket) -> None:
         """Write this response to a socket.
+
+        Responses with a pre-serialized head and a small in-memory
+        body go out in a single sendall.  Otherwise, on Linux the
+        socket is corked while the headers and body are written so the
+        two sends coalesce into as few TCP segments as possible
+        instead of one undersized packet per write.
+        """
+        if self.head is not None and isinstance(self.body, memoryview) \
+                and len(self.head) + len(self.body) <= _COALESCE_MAX_SIZE:
+            sock.sendall(b"".join((self.head, self.body)))
+            return
+
+        cork = hasattr(socket, "TCP_CORK")
+        if cork:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+
+        try:
+            if self.head is not None:
+                sock.sendall(self.head)
+                self.send_body(sock)
+            else:
+                content_length = self.send_headers(sock)
+                if content_length > 0:
+                    self.send_body(sock)
+        finally:
+            if cork:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+
+    def send_headers(self, sock: socket.socket) -> int:
+        """Write the status line and headers to a socket, adding a
+        content-length header if one isn't already set.  Returns the
+        content length of the body.
         """
         content_length = self.headers.get_int("content-length")
         if content_length is None:
-            try:
-                body_stat = os.fstat(self.body.fileno())
-                content_length = body_stat.st_size
-            except OSError:
-                self.body.seek(0, os.SEEK_END)
-                content_length = self.body.tell()
-                self.body.seek(0, os.SEEK_SET)
-
-            if content_length > 0:
-                self.headers.add("content-length", str(content_length))
-
-        headers = b"HTTP/1.1 " + self.status + b"\r\n"
+            if isinstance(self.body, memoryview):
+                content_length = len(self.body)
+            else:
+                try:
+                    body_stat = os.fstat(self.body.fileno())
+                    content_length = body_stat.st_size
+                except OSError:
+                    self.body.seek(0, os.SEEK_END)
+                    content_length = self.body.tell()
+                    self.body.seek(0, os.SEEK_SET)
+
+            # Always announce the length, even when it's zero --
+            # without it a keep-alive client has no way to tell an
+            # empty body from one that's still on its way and stalls
+            # until the idle timeout closes the connection.
+            self.headers.add("content-length", str(content_length))
+
+        buff = bytearray(b"HTTP/1.1 ")
+        buff += self.status
+        buff += b"\r\n"
         for header_name, header_value in self.headers:
-            headers += f"{header_name}: {header_value}\r\n".encode()
+            buff += f"{header_name}: {header_value}\r\n".encode()
+
+        buff += b"\r\n"
+        sock.sendall(buff)
+        return content_length
 
-        sock.sendall(headers + b"\r\n")
-        if content_length > 0:
+    def send_body(self, sock: socket.socket) -> None:
+        """Write the response body to a socket.
+
+        File bodies go through socket.sendfile, which uses the
+        sendfile(2) syscall on Linux to copy the file to the socket
+        without going through userspace.  Buffer bodies (eg. mmapped
+        files) are written directly.
+        """
+        if isinstance(self.body, memoryview):
+            sock.sendall(self.body)
+        else:
             sock.sendfile(self.body)  # type: ignore
@@ -1,10 +1,13 @@
 # https://developer.mozilla.org/en-US/docs/Web/HTTP/Basics_of_HTTP/MIME_types
+import functools
 import logging
 import mimetypes
+import mmap
 import os
+import selectors
 import socket
-from queue import Empty, Queue
-from threading import Thread
+from collections import OrderedDict
+from threading import Lock, Thread
 from typing import Callable, List, Tuple
 
 from .request import Request
@@ -15,43 +18,125 @@ LOGGER = logging.getLogger(__name__)
 HandlerT = Callable[[Request], Response]
 
 
+def _precompile_response(status: str, content: str = "") -> bytes:
+    """Serialize a fixed response to bytes once, at import time, so
+    the common error paths are a single sendall with no Response
+    object or header formatting per request.
+    """
+    body = content.encode()
+    headers = f"HTTP/1.1 {status}\r\n"
+    if body:
+        headers += f"content-length: {len(body)}\r\n"
+
+    return headers.encode() + b"\r\n" + body
+
+
+# How long a keep-alive connection may sit idle between requests
+# before it gets dropped.
+_KEEP_ALIVE_TIMEOUT = 5
+
+_OK_TEMPLATE = b"HTTP/1.1 200 OK\r\ncontent-type: %s\r\ncontent-length: %d\r\n\r\n"
+
+_RESPONSE_CONTINUE = _precompile_response("100 Continue")
+_RESPONSE_BAD_REQUEST = _precompile_response("400 Bad Request", "Bad Request")
+_RESPONSE_NOT_FOUND = _precompile_response("404 Not Found", "Not Found")
+_RESPONSE_INTERNAL_ERROR = _precompile_response("500 Internal Server Error", "Internal Error")
+
+# An LRU of mmapped static files keyed by absolute path.  The mappings
+# share page-cache pages across workers and requests so hot assets are
+# served without re-reading them from disk.  The lock keeps the
+# lookup/move-to-end and insert/evict sequences atomic across workers;
+# an uncontended acquire is nothing next to the stat and mmap around it.
+_MMAP_CACHE: "OrderedDict[str, Tuple[int, int, memoryview, bytes]]" = OrderedDict()
+_MMAP_CACHE_LOCK = Lock()
+_MMAP_CACHE_MAX_ENTRIES = 64
+
+
+def _mmap_file(abspath: str, stat_result: os.stat_result) -> Tuple[memoryview, bytes]:
+    """Return a read-only view of the file at abspath along with its
+    pre-serialized 200 head, reusing a cached pair when the file hasn't
+    changed since it was mapped.
+    """
+    with _MMAP_CACHE_LOCK:
+        entry = _MMAP_CACHE.get(abspath)
+        if entry is not None:
+            mtime_ns, size, data, head = entry
+            if mtime_ns == stat_result.st_mtime_ns and size == stat_result.st_size:
+                _MMAP_CACHE.move_to_end(abspath)
+                return data, head
+
+    with open(abspath, "rb") as f:
+        if stat_result.st_size == 0:
+            # Zero-length files can't be mmapped.
+            data = memoryview(b"")
+        else:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    # Size the head off of the mapping itself, not the stat -- the file
+    # may have changed in between and the mapping is what gets sent.
+    head = _OK_TEMPLATE % (_content_type_for(abspath).encode("latin-1"), len(data))
+    with _MMAP_CACHE_LOCK:
+        _MMAP_CACHE[abspath] = (stat_result.st_mtime_ns, stat_result.st_size, data, head)
+        while len(_MMAP_CACHE) > _MMAP_CACHE_MAX_ENTRIES:
+            _MMAP_CACHE.popitem(last=False)
+
+    return data, head
+
+
+@functools.lru_cache(maxsize=256)
+def _content_type_for(abspath: str) -> str:
+    """Guess the full content-type header value for the file at
+    abspath.  Memoized because guess_type runs a Python-level suffix
+    scan and the same assets get served over and over.
+    """
+    content_type, encoding = mimetypes.guess_type(abspath)
+    if content_type is None:
+        content_type = "application/octet-stream"
+
+    if encoding is not None:
+        content_type += f"; charset={encoding}"
+
+    return content_type
+
+
 def serve_static(server_root: str) -> HandlerT:
     """Generate a request handler that serves file off of disk
     relative to server_root.
     """
+    # Resolve the root once up front.  Checking the request path
+    # against a relative root would false-negative (and 404) every
+    # request, and the trailing separator stops /wwwevil from passing
+    # a prefix check against /www.
+    server_root = os.path.abspath(server_root)
+    server_root_prefix = server_root + os.sep
 
     def handler(request: Request) -> Response:
         path = request.path
         if request.path == "/":
             path = "/index.html"
 
-        abspath = os.path.normpath(os.path.join(server_root, path.lstrip("/")))
-        if not abspath.startswith(server_root):
+        abspath = os.path.abspath(os.path.join(server_root, path.lstrip("/")))
+        if not abspath.startswith(server_root_prefix):
             return Response(status="404 Not Found", content="Not Found")
 
         try:
-            content_type, encoding = mimetypes.guess_type(abspath)
-            if content_type is None:
-                content_type = "application/octet-stream"
-
-            if encoding is not None:
-                content_type += f"; charset={encoding}"
-
-            body_file = open(abspath, "rb")  # no close?
-            response = Response(status="200 OK", body=body_file)
-            response.headers.add("content-type", content_type)
+            stat_result = os.stat(abspath)
+            data, head = _mmap_file(abspath, stat_result)
+            # The content-type and content-length headers are baked
+            # into the cached head.
+            response = Response(status="200 OK", body=data, head=head)
             return response
-        except FileNotFoundError:
+        except (FileNotFoundError, IsADirectoryError):
             return Response(status="404 Not Found", content="Not Found")
 
     return handler
 
 
 class HTTPWorker(Thread):
-    def __init__(self, connection_queue: Queue, handlers: List[Tuple[str, HandlerT]]) -> None:
+    def __init__(self, server_sock: socket.socket, handlers: List[Tuple[str, HandlerT]]) -> None:
         super().__init__(daemon=True)
 
-        self.connection_queue = connection_queue
+        self.server_sock = server_sock
         self.handlers = handlers
         self.running = False
 
@@ -60,56 +145,88 @@ class HTTPWorker(Thread):
 
     def run(self) -> None:
         self.running = True
-        while self.running:
-            try:
-                client_sock, client_addr = self.connection_queue.get(timeout=1)
-                # print(f"New connection from {client_addr}.")
-            except Empty:
-                continue
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.server_sock, selectors.EVENT_READ)
+            while self.running:
+                # The timeout lets us periodically check whether we've
+                # been stopped.
+                if not selector.select(timeout=1):
+                    continue
+
+                # Drain every connection that's already queued on the
+                # socket in one go, so we pay one epoll wakeup for a
+                # whole batch of accepts.
+                while self.running:
+                    try:
+                        client_sock, client_addr = self.server_sock.accept()
+                    except BlockingIOError:
+                        break
+                    except OSError:
+                        # The listening socket was closed out from
+                        # under us during shutdown.
+                        return
 
-            try:
-                self.handle_client(client_sock, client_addr)
-            except Exception as e:
-                print(f"Unhandled error: {e}")
-                continue
-            finally:
-                # https://stackoverflow.com/questions/49637086/python-what-is-queue-task-done-used-for
-                self.connection_queue.task_done()
+                    if LOGGER.isEnabledFor(logging.DEBUG):
+                        LOGGER.debug("New connection from %s.", client_addr)
+
+                    try:
+                        self.handle_client(client_sock, client_addr)
+                    except Exception:
+                        LOGGER.exception("Unhandled error while serving %s.", client_addr)
+                        continue
 
     def handle_client(self, client_sock: socket.socket,
                       client_addr: Tuple[str, int]) -> None:
         with client_sock:
-            try:
-                request = Request.from_socket(client_sock)
-                # print(request)
-            except Exception:
-                LOGGER.warning("Failed to parse request.", exc_info=True)
-                response = Response(status="400 Bad Request", content="Bad Request")
-                response.send(client_sock)
-                return
-
-            # Force clients to send their request bodies on every
-            # request rather than making the handlers deal with this.
-            if "100-continue" in request.headers.get("expect", ""):
-                response = Response(status="100 Continue")
-                response.send(client_sock)
-
-            for path_prefix, handler in self.handlers:
-                if request.path.startswith(path_prefix):
-                    try:
-                        request = request._replace(path=request.path[len(path_prefix):])
-                        response = handler(request)
-                        response.send(client_sock)
-                    except Exception:
-                        LOGGER.exception("Unexpected error from handler %r.", handler)
-                        response = Response(status="500 Internal Server Error",
-                                            content="Internal Error")
-                        response.send(client_sock)
-                    finally:
-                        break
-            else:
-                response = Response(status="404 Not Found", content="Not Found")
-                response.send(client_sock)
+            # Don't let Nagle's algorithm hold small header writes
+            # back waiting for an ACK.
+            client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            # Bound how long an idle connection can hold this worker.
+            client_sock.settimeout(_KEEP_ALIVE_TIMEOUT)
+
+            # HTTP/1.1 connections are keep-alive by default, so serve
+            # requests off of this connection until the client closes
+            # it, goes idle or asks us to stop.
+            buff = b""
+            while True:
+                try:
+                    request = Request.from_socket(client_sock, buff=buff)
+                except (EOFError, socket.timeout):
+                    return
+                except Exception:
+                    LOGGER.warning("Failed to parse request.", exc_info=True)
+                    client_sock.sendall(_RESPONSE_BAD_REQUEST)
+                    return
+
+                # Force clients to send their request bodies on every
+                # request rather than making the handlers deal with this.
+                if "100-continue" in request.headers.get("expect", ""):
+                    client_sock.sendall(_RESPONSE_CONTINUE)
+
+                for path_prefix, handler in self.handlers:
+                    if request.path.startswith(path_prefix):
+                        try:
+                            request = request._replace(path=request.path[len(path_prefix):])
+                            response = handler(request)
+                            response.send(client_sock)
+                        except Exception:
+                            LOGGER.exception("Unexpected error from handler %r.", handler)
+                            client_sock.sendall(_RESPONSE_INTERNAL_ERROR)
+                        finally:
+                            break
+                else:
+                    client_sock.sendall(_RESPONSE_NOT_FOUND)
+
+                if request.headers.get("connection", "").lower() == "close":
+                    return
+
+                # Skip whatever is left of the body so the next request
+                # starts at a message boundary.
+                try:
+                    buff = request.body.drain()
+                except socket.timeout:
+                    return
 
 
 class HTTPServer:
@@ -118,7 +235,6 @@ class HTTPServer:
         self.port = port
         self.worker_count = worker_count
         self.worker_backlog = worker_count * 8
-        self.connection_queue: Queue = Queue(self.worker_backlog)
         self.handlers: List[Tuple[str, HandlerT]] = []
 
     def mount(self, path_prefix: str, handler: HandlerT) -> None:
@@ -129,37 +245,60 @@ class HTTPServer:
         self.handlers.append((path_prefix, handler))
 
     def serve_forever(self) -> None:
+        # Every worker listens on its own socket bound to the same
+        # address via SO_REUSEPORT, so the kernel load-balances
+        # incoming connections across the workers and each one accepts
+        # off of its own queue without sharing anything in Python.
         workers = []
-        for _ in range(self.worker_count):
-            worker = HTTPWorker(self.connection_queue, self.handlers)
-            worker.start()
-            workers.append(worker)
+        server_socks = []
+        try:
+            for _ in range(self.worker_count):
+                server_sock = self._make_server_sock()
+                server_socks.append(server_sock)
+
+                worker = HTTPWorker(server_sock, self.handlers)
+                worker.start()
+                workers.append(worker)
+
+            LOGGER.info("Listening on %s:%s...", self.host, self.port)
+
+            try:
+                for worker in workers:
+                    worker.join()
+            except KeyboardInterrupt:
+                pass
+        finally:
+            for worker in workers:
+                worker.stop()
+
+            for worker in workers:
+                worker.join(timeout=30)
+
+            for server_sock in server_socks:
+                server_sock.close()
 
+    def _make_server_sock(self) -> socket.socket:
         # By default, socket.socket creates TCP sockets.
-        with socket.socket() as server_sock:
-            # This tells the kernel to reuse sockets that are in `TIME_WAIT` state.
-            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_sock = socket.socket()
 
-            # This tells the socket what address to bind to.
-            server_sock.bind((self.host, self.port))
+        # This tells the kernel to reuse sockets that are in `TIME_WAIT` state.
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-            # 0 is the number of pending connections the socket may have before
-            # new connections are refused.  Since this server is going to process
-            # one connection at a time, we want to refuse any additional connections.
-            server_sock.listen(self.worker_backlog)
-            print(f"Listening on {self.host}: {self.port}...")
+        # This lets multiple sockets bind the same address so each
+        # worker can have its own.
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
-            while True:
-                try:
-                    self.connection_queue.put(server_sock.accept())
-                except KeyboardInterrupt:
-                    break
+        # This tells the socket what address to bind to.
+        server_sock.bind((self.host, self.port))
 
-        for worker in workers:
-            worker.stop()
+        # The number of pending connections the socket may have before
+        # new connections are refused.
+        server_sock.listen(self.worker_backlog)
 
-        for worker in workers:
-            worker.join(timeout=30)
+        # Workers wait for connections through a selector and drain
+        # the accept queue without blocking.
+        server_sock.setblocking(False)
+        return server_sock
 
 
 def app(request: Request) -> Response: